@@ -1,17 +1,69 @@
+import os
 import re
 import sys
 import json
+import codecs
+import hashlib
 import asyncio
 import signal
 import logging
 import argparse
 from pathlib import Path
-from typing import Dict, Set
+from typing import Dict, Tuple
 
-import aiofiles
 import aiohttp
 from aiohttp import web
 from jinja2 import Environment, FileSystemLoader
+from watchfiles import Change, awatch
+
+try:
+    from orjson import dumps as json_dumps
+except ImportError:
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+ANSI_ESCAPE = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+FLUSH_BYTES = 64 * 1024
+FLUSH_DELAY = 0.02
+CLIENT_QUEUE_SIZE = 128
+RING_CAPACITY = 1 << 20
+WATCH_STEP_MS = 5
+
+class RingBuffer:
+    __slots__ = ('buf', 'head', 'size')
+
+    def __init__(self, capacity: int):
+        self.buf = bytearray(capacity)
+        self.head = 0
+        self.size = 0
+
+    def append(self, data: bytes) -> None:
+        capacity = len(self.buf)
+        view = memoryview(self.buf)
+        if len(data) >= capacity:
+            view[:] = data[len(data) - capacity:]
+            self.head, self.size = 0, capacity
+            return
+
+        end = self.head + len(data)
+        if end <= capacity:
+            view[self.head:end] = data
+        else:
+            split = capacity - self.head
+            view[self.head:] = data[:split]
+            view[:end - capacity] = data[split:]
+        self.head = end % capacity
+        self.size = min(self.size + len(data), capacity)
+
+    def clear(self) -> None:
+        self.head = self.size = 0
+
+    def read_all(self) -> Tuple[memoryview, memoryview]:
+        view = memoryview(self.buf)
+        start = self.head - self.size
+        if start >= 0:
+            return view[start:self.head], view[:0]
+        return view[start:], view[:self.head]
 
 class VigilServer:
     def __init__(self, config_file, max_lines, port):
@@ -36,6 +88,7 @@ class VigilServer:
             handlers=[logging.FileHandler(self.log_dir / 'vigil.log', mode='w')]
         )
         self.logger = logging.getLogger('vigil')
+        logging.getLogger('watchfiles').setLevel(logging.WARNING)
 
         self.logger.info(f'Log directory: {self.log_dir.absolute()}')
         self.logger.info(f'Monitoring {len(self.processes)} processes (max {max_lines} lines each):')
@@ -44,11 +97,34 @@ class VigilServer:
             exists = '✅' if log_path.exists() else '❌'
             self.logger.info(f'\t{exists} {proc['name']} -> {log_path}')
 
-        self.websocket_clients: Set[web.WebSocketResponse] = set()
+        self.websocket_clients: Dict[web.WebSocketResponse, asyncio.Queue] = {}
         self.running_processes: Dict[str, asyncio.subprocess.Process] = {}
         self.file_positions: Dict[str, int] = {}
+        self.log_fds: Dict[str, int] = {}
+        self.log_stats: Dict[str, Tuple[int, int, int]] = {}
+        self.pending_logs: Dict[str, bytearray] = {}
+        self.logs_pending = asyncio.Event()
+        self.flush_requested = asyncio.Event()
+        self.log_paths: Dict[str, Path] = {
+            proc['name']: (self.log_dir / proc['logFile']).resolve() for proc in self.processes
+        }
+        self.log_rings: Dict[str, RingBuffer] = {
+            process_name: RingBuffer(RING_CAPACITY) for process_name in self.log_paths
+        }
+        self.log_decoders: Dict[str, codecs.IncrementalDecoder] = {
+            process_name: codecs.getincrementaldecoder('utf-8')(errors='replace')
+            for process_name in self.log_paths
+        }
+        self.log_file_processes: Dict[str, str] = {
+            str(log_path): process_name for process_name, log_path in self.log_paths.items()
+        }
 
         self.jinja_env = Environment(loader=FileSystemLoader(self.templates_dir))
+        template = self.jinja_env.get_template('index.html')
+        self.index_html = template.render(
+            processes=self.processes, ws_port=self.port, max_lines=self.max_lines
+        ).encode('utf-8')
+        self.index_etag = f'"{hashlib.sha1(self.index_html).hexdigest()}"'
 
         self.ansi_color_map = {
             30: '#000000', 31: '#e74c3c', 32: '#2ecc71', 33: '#f39c12',
@@ -58,53 +134,156 @@ class VigilServer:
         }
 
     def clean_ansi_codes(self, text: str) -> str:
-        ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
-        return ansi_escape.sub('', text)
+        return ANSI_ESCAPE.sub('', text)
 
     async def monitor_log_files(self) -> None:
-        while True:
-            for process in self.processes:
-                process_name = process['name']
-                log_file = self.log_dir / process['logFile']
-                if not log_file.exists(): continue
-
-                try:
-                    current_size = log_file.stat().st_size
-                    last_position = self.file_positions.get(process_name, 0)
-
-                    if current_size > last_position:
-                        async with aiofiles.open(log_file, mode='r') as f:
-                            await f.seek(last_position)
-                            new_content = await f.read()
+        for process_name, log_file in self.log_paths.items():
+            await self.load_log_file(process_name, log_file)
+
+        watch_dirs = {log_file.parent for log_file in self.log_paths.values()}
+        for watch_dir in watch_dirs:
+            if watch_dir.is_relative_to(self.log_dir):
+                watch_dir.mkdir(exist_ok=True, parents=True)
+
+        watch_filter = lambda _, path: path in self.log_file_processes
+        async for changes in awatch(
+            *(watch_dir for watch_dir in watch_dirs if watch_dir.is_dir()),
+            watch_filter=watch_filter, step=WATCH_STEP_MS, recursive=False
+        ):
+            for change, path in changes:
+                if change == Change.deleted:
+                    self.close_log_file(self.log_file_processes[path])
+
+            for path in {path for _, path in changes}:
+                await self.tail_log_file(self.log_file_processes[path], Path(path))
+
+    async def load_log_file(self, process_name: str, log_file: Path) -> None:
+        try:
+            stat = log_file.stat()
+            current_size = stat.st_size
+            if current_size <= RING_CAPACITY:
+                fd = self.log_fds[process_name] = os.open(log_file, os.O_RDONLY)
+                data = await asyncio.to_thread(os.pread, fd, current_size, 0)
+                self.log_rings[process_name].append(data)
+                current_size = len(data)
+            self.file_positions[process_name] = current_size
+            self.log_stats[process_name] = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+        except (OSError, IOError):
+            return
+
+    async def tail_log_file(self, process_name: str, log_file: Path) -> None:
+        try:
+            stat = log_file.stat()
+            stat_key = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+            previous_key = self.log_stats.get(process_name)
+            if previous_key == stat_key:
+                return
+
+            if previous_key is not None and previous_key[2] != stat.st_ino:
+                self.close_log_file(process_name)
+            fd = self.log_fds.get(process_name)
+
+            current_size = stat.st_size
+            last_position = self.file_positions.get(process_name, 0)
+            if current_size < last_position:
+                last_position = 0
+                self.log_rings[process_name].clear()
+                self.log_decoders[process_name].reset()
+
+            data = b''
+            if current_size > last_position:
+                if fd is None:
+                    fd = self.log_fds[process_name] = os.open(log_file, os.O_RDONLY)
+                data = await asyncio.to_thread(os.pread, fd, current_size - last_position, last_position)
+
+            if data:
+                self.log_rings[process_name].append(data)
+                self.queue_log(process_name, data)
+
+            self.file_positions[process_name] = last_position + len(data)
+            self.log_stats[process_name] = stat_key
+
+        except (OSError, IOError):
+            return
+
+    def close_log_file(self, process_name: str) -> None:
+        if (fd := self.log_fds.pop(process_name, None)) is not None:
+            os.close(fd)
+        self.file_positions.pop(process_name, None)
+        self.log_stats.pop(process_name, None)
+        self.log_rings[process_name].clear()
+        self.log_decoders[process_name].reset()
+
+    def ring_is_current(self, process_name: str) -> bool:
+        try:
+            stat = self.log_paths[process_name].stat()
+        except OSError:
+            return False
+        return (
+            self.log_stats.get(process_name) == (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+            and self.file_positions.get(process_name) == self.log_rings[process_name].size
+        )
 
-                        if new_content:
-                            cleaned_content = self.clean_ansi_codes(new_content)
-                            self.logger.debug(f'Broadcasting {len(cleaned_content)} chars from {process_name}')
-                            await self.broadcast_log(process_name, cleaned_content)
+    def queue_log(self, process_name: str, data: bytes) -> None:
+        buffer = self.pending_logs.setdefault(process_name, bytearray())
+        buffer += data
+        self.logs_pending.set()
+        if len(buffer) >= FLUSH_BYTES:
+            self.flush_requested.set()
 
-                        self.file_positions[process_name] = current_size
+    def clients_backlogged(self) -> bool:
+        return any(queue.qsize() >= CLIENT_QUEUE_SIZE // 2 for queue in self.websocket_clients.values())
 
-                except (OSError, IOError):
+    async def flush_logs(self) -> None:
+        loop = asyncio.get_running_loop()
+        last_flush = -FLUSH_DELAY
+        while True:
+            await self.logs_pending.wait()
+            if loop.time() - last_flush < FLUSH_DELAY or self.clients_backlogged():
+                try:
+                    await asyncio.wait_for(self.flush_requested.wait(), timeout=FLUSH_DELAY)
+                except asyncio.TimeoutError:
+                    pass
+
+            last_flush = loop.time()
+            self.logs_pending.clear()
+            self.flush_requested.clear()
+            pending, self.pending_logs = self.pending_logs, {}
+            for process_name, data in pending.items():
+                cleaned_content = self.clean_ansi_codes(self.log_decoders[process_name].decode(data))
+                if not cleaned_content:
                     continue
+                self.logger.debug(f'Broadcasting {len(cleaned_content)} chars from {process_name}')
+                self.broadcast_log(process_name, cleaned_content)
 
-            await asyncio.sleep(0.1)
-
-    async def broadcast_log(self, process_name: str, data: str) -> None:
+    def broadcast_log(self, process_name: str, data: str) -> None:
         if self.websocket_clients:
-            message = json.dumps({'process': process_name, 'data': data})
-            closed_clients = {ws for ws in self.websocket_clients if ws.closed}
-            self.websocket_clients.difference_update(closed_clients)
-            if self.websocket_clients:
-                await asyncio.gather(
-                    *[ws.send_str(message) for ws in self.websocket_clients],
-                    return_exceptions=True
-                )
+            payload = json_dumps({'process': process_name, 'data': data})
+            for queue in self.websocket_clients.values():
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(payload)
+
+    async def client_writer(self, ws: web.WebSocketResponse, queue: asyncio.Queue) -> None:
+        try:
+            while True:
+                await ws.send_bytes(await queue.get())
+        except ConnectionError:
+            pass
+        except Exception as e:
+            self.logger.warning(f'WebSocket send error: {e}')
+
+        self.websocket_clients.pop(ws, None)
+        await asyncio.shield(ws.close())
 
     async def websocket_handler(self, request: web.Request) -> web.WebSocketResponse:
-        ws = web.WebSocketResponse()
+        ws = web.WebSocketResponse(compress=False, heartbeat=30)
         await ws.prepare(request)
 
-        self.websocket_clients.add(ws)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        writer_task = asyncio.create_task(self.client_writer(ws, queue))
+        self.websocket_clients[ws] = queue
         self.logger.info(f'Client connected (total: {len(self.websocket_clients)})')
 
         try:
@@ -115,55 +294,35 @@ class VigilServer:
         except Exception as e:
             self.logger.error(f'WebSocket exception: {e}')
         finally:
-            self.websocket_clients.discard(ws)
+            self.websocket_clients.pop(ws, None)
+            writer_task.cancel()
             self.logger.info(f'Client client disconnected (total: {len(self.websocket_clients)})')
 
         return ws
 
     async def index_handler(self, request: web.Request) -> web.Response:
-        template = self.jinja_env.get_template('index.html')
-        html = template.render(processes=self.processes, ws_port=self.port, max_lines=self.max_lines)
-        return web.Response(text=html, content_type='text/html')
-
-    async def static_handler(self, request: web.Request) -> web.Response:
-        filename = request.match_info['filename']
-        file_path = self.static_dir / filename
-
-        if not file_path.exists() or not file_path.is_file():
-            return web.Response(status=404, text='File not found')
-
-        content_type = 'text/plain'
-        if filename.endswith('.css'):
-            content_type = 'text/css'
-        elif filename.endswith('.js'):
-            content_type = 'application/javascript'
-        elif filename.endswith('.html'):
-            content_type = 'text/html'
-
-        async with aiofiles.open(file_path, mode='r') as f:
-            content = await f.read()
-
-        return web.Response(text=content, content_type=content_type)
+        headers = {'ETag': self.index_etag}
+        if request.headers.get('If-None-Match') == self.index_etag:
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=self.index_html, content_type='text/html', charset='utf-8', headers=headers)
 
     async def log_handler(self, request: web.Request) -> web.Response:
         log_name = request.match_info['log_name']
 
         process_name = log_name.replace('.log', '')
-        process_config = next((p for p in self.processes if p['name'] == process_name), None)
+        ring = self.log_rings.get(process_name)
+        if ring is not None and self.ring_is_current(process_name):
+            return web.Response(body=b''.join(ring.read_all()), content_type='text/plain', charset='utf-8')
 
-        log_path = (
-            self.log_dir / process_config['logFile']
-            if process_config
-            else self.log_dir / log_name
-        )
+        log_path = self.log_paths.get(process_name) or self.log_dir / log_name
 
-        if log_path.exists():
-            async with aiofiles.open(log_path, mode='r') as f:
-                content = await f.read()
-            return web.Response(text=content, content_type='text/plain')
-        else:
+        try:
+            body = await asyncio.to_thread(log_path.read_bytes)
+        except OSError:
             return web.Response(text='', content_type='text/plain')
 
+        return web.Response(body=body, content_type='text/plain', charset='utf-8')
+
     async def cleanup_processes(self) -> None:
         self.logger.info('\nCleaning up processes...')
         for name, process in self.running_processes.items():
@@ -179,6 +338,9 @@ class VigilServer:
                 except Exception as e:
                     self.logger.info(f'Error stopping {name}: {e}')
 
+        for process_name in list(self.log_fds):
+            self.close_log_file(process_name)
+
     def setup_signal_handlers(self, loop: asyncio.AbstractEventLoop) -> None:
         def signal_handler():
             self.logger.info('\nReceived shutdown signal...')
@@ -193,7 +355,7 @@ class VigilServer:
 
         app.router.add_get('/', self.index_handler)
         app.router.add_get('/ws', self.websocket_handler)
-        app.router.add_get('/static/{filename}', self.static_handler)
+        app.router.add_static('/static/', self.static_dir, follow_symlinks=False)
         app.router.add_get('/logs/{log_name}', self.log_handler)
 
         runner = web.AppRunner(app, access_log=None)
@@ -218,6 +380,7 @@ class VigilServer:
         try:
             self.logger.info('Running in viewer-only mode. Monitoring log files...')
             monitor_task = asyncio.create_task(self.monitor_log_files())
+            flush_task = asyncio.create_task(self.flush_logs())
             await asyncio.Event().wait()
 
         except KeyboardInterrupt:
@@ -263,7 +426,13 @@ def main():
     server = VigilServer(config_file, args.max_lines, args.port)
 
     try:
-        asyncio.run(server.run())
+        import uvloop
+        loop_factory = uvloop.new_event_loop
+    except ImportError:
+        loop_factory = None
+
+    try:
+        asyncio.run(server.run(), loop_factory=loop_factory)
     except KeyboardInterrupt:
         print('\nGoodbye!')
         sys.exit(0)